@@ -1,27 +1,48 @@
 import os
+import json
 import logging
+import wave
+import time
 import tempfile
 from pathlib import Path
 import asyncio
+from io import BytesIO
 from datetime import datetime
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
 from dotenv import load_dotenv
 
 from aiogram import Bot, Dispatcher, types, F
-from aiogram.filters import Command
+from aiogram.exceptions import TelegramAPIError
+from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.types import (
     ReplyKeyboardMarkup, KeyboardButton, 
     InlineKeyboardMarkup, InlineKeyboardButton,
-    FSInputFile
+    BufferedInputFile
 )
 from aiogram.utils.keyboard import ReplyKeyboardBuilder, InlineKeyboardBuilder
 
-import moviepy.editor as mp
-import whisper
+import numpy as np
+import ctranslate2
+from faster_whisper import WhisperModel
 from googletrans import Translator as GoogleTranslator
-from gtts import gTTS
+
+# piper-tts ставится только на Linux с Python до 3.12 (см. README):
+# без него озвучка отключается, остальные функции работают
+try:
+    from piper.voice import PiperVoice
+except ImportError:
+    PiperVoice = None
+
+# uvloop необязателен (нет под Windows): без него работает стандартный цикл asyncio
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
 
 # Загрузка переменных окружения
 load_dotenv()
@@ -43,13 +64,76 @@ bot = Bot(token=BOT_TOKEN)
 storage = MemoryStorage()
 dp = Dispatcher(storage=storage)
 
+# Один клиент переводчика на все запросы (переиспользует HTTP-соединения).
+# googletrans не потокобезопасен, поэтому переводы идут в отдельном однопоточном
+# пуле: медленный Google не занимает потоки общего пула, нужные остальным задачам
+translator = GoogleTranslator()
+_TRANSLATE_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="translate")
+
+# Число одновременных тяжелых задач (распознавание, озвучка, перекодирование)
+MAX_HEAVY_JOBS = max(1, int(os.getenv("MAX_HEAVY_JOBS", "2")))
+
 # Загрузка модели Whisper (один раз при старте)
+# По умолчанию tiny: для коротких голосовых хватает качества при кратно большей скорости.
+# На GPU используем FP16 (тензорные ядра), на CPU - int8-веса CTranslate2
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "tiny")
+WHISPER_DEVICE = os.getenv(
+    "WHISPER_DEVICE",
+    "cuda" if ctranslate2.get_cuda_device_count() > 0 else "cpu"
+)
+WHISPER_COMPUTE = os.getenv(
+    "WHISPER_COMPUTE",
+    "float16" if WHISPER_DEVICE == "cuda" else "int8"
+)
+
+def load_whisper_model(device, compute_type):
+    """Загрузка модели Whisper с пробным распознаванием секунды тишины"""
+    model = WhisperModel(
+        WHISPER_MODEL,
+        device=device,
+        compute_type=compute_type,
+        # Каждый из MAX_HEAVY_JOBS параллельных запросов получает свой воркер и долю ядер
+        num_workers=MAX_HEAVY_JOBS,
+        cpu_threads=max(1, (os.cpu_count() or 1) // MAX_HEAVY_JOBS)
+    )
+    # Библиотеки CUDA/cuDNN подгружаются лениво, поэтому их нехватка видна только при распознавании
+    segments, _ = model.transcribe(np.zeros(16000, dtype=np.float32), language='ru')
+    list(segments)
+    return model
+
 try:
-    whisper_model = whisper.load_model("base")
-    logger.info("Модель Whisper загружена успешно")
+    whisper_model = load_whisper_model(WHISPER_DEVICE, WHISPER_COMPUTE)
 except Exception as e:
-    logger.error(f"Ошибка загрузки Whisper: {e}")
+    logger.error(f"Ошибка загрузки Whisper ({WHISPER_DEVICE}, {WHISPER_COMPUTE}): {e}")
     whisper_model = None
+    if WHISPER_DEVICE != "cpu":
+        # Например, драйвер NVIDIA есть, а нужных CUDA 12 / cuDNN 9 нет
+        WHISPER_DEVICE, WHISPER_COMPUTE = "cpu", "int8"
+        try:
+            whisper_model = load_whisper_model(WHISPER_DEVICE, WHISPER_COMPUTE)
+        except Exception as e:
+            logger.error(f"Ошибка загрузки Whisper на CPU: {e}")
+if whisper_model is not None:
+    logger.info(f"Модель Whisper {WHISPER_MODEL} загружена успешно ({WHISPER_DEVICE}, {WHISPER_COMPUTE})")
+
+# Загрузка голоса Piper для озвучки (один раз при старте, см. README)
+PIPER_VOICE = os.getenv("PIPER_VOICE", "ru_RU-irina-medium.onnx")
+if PiperVoice is None:
+    logger.warning("piper-tts не установлен, озвучка текста отключена")
+    piper_voice = None
+else:
+    try:
+        piper_voice = PiperVoice.load(PIPER_VOICE)
+        logger.info("Голос Piper загружен успешно")
+    except Exception as e:
+        logger.error(f"Ошибка загрузки голоса Piper {PIPER_VOICE} (нужны .onnx и .onnx.json, см. README): {e}")
+        piper_voice = None
+
+# Ограничение числа одновременных тяжелых задач
+_HEAVY_JOBS = asyncio.Semaphore(MAX_HEAVY_JOBS)
+# Свой пул потоков для Whisper по числу воркеров модели: распознавание, уже занявшее
+# слот _HEAVY_JOBS, не ждет в очереди общего пула
+_WHISPER_EXECUTOR = ThreadPoolExecutor(max_workers=MAX_HEAVY_JOBS, thread_name_prefix="whisper")
 
 # Класс состояний FSM
 class BotStates(StatesGroup):
@@ -73,8 +157,186 @@ LANGUAGES = {
     '🇰🇷 Корейский': 'ko',
     '🇦🇪 Арабский': 'ar'
 }
+LANG_NAME_BY_CODE = {code: name for name, code in LANGUAGES.items()}
+
+# Работа с ffmpeg
+# Аппаратные кодировщики H.264 в порядке предпочтения и их параметры скорости
+HW_ENCODERS = (
+    ('h264_nvenc', ['-preset', 'p4', '-tune', 'll']),
+    ('h264_qsv', ['-preset', 'veryfast']),
+    ('h264_amf', ['-quality', 'speed']),
+    ('h264_videotoolbox', ['-realtime', '1']),
+)
+
+# Выбранный кодировщик (определяется один раз при старте в detect_encoders)
+_ENC = {'video': 'libx264', 'preset_args': ['-preset', 'veryfast'], 'nvdec': False}
+
+async def run_ffmpeg(*args, input=None):
+    """Запуск ffmpeg без блокировки цикла событий, возвращает вывод из stdout"""
+    proc = await asyncio.create_subprocess_exec(
+        'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y', *args,
+        stdin=asyncio.subprocess.PIPE if input is not None else asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await proc.communicate(input)
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg завершился с ошибкой: {stderr.decode(errors='ignore').strip()}")
+    return stdout
+
+async def detect_encoders():
+    """Выбор самого быстрого доступного кодировщика H.264 и проверка NVDEC"""
+    try:
+        encoders = (await run_ffmpeg('-encoders')).decode(errors='ignore')
+        decoders = (await run_ffmpeg('-decoders')).decode(errors='ignore')
+    except (OSError, RuntimeError) as e:
+        logger.error(f"Не удалось получить список кодеков ffmpeg: {e}")
+        return
+    
+    for name, preset_args in HW_ENCODERS:
+        if name not in encoders:
+            continue
+        # Кодировщик может быть в сборке без нужного устройства, поэтому пробуем закодировать кадр
+        try:
+            await run_ffmpeg(
+                '-f', 'lavfi', '-i', 'color=size=256x256:duration=0.1',
+                '-c:v', name, *preset_args,
+                '-f', 'null', '-'
+            )
+        except RuntimeError:
+            continue
+        _ENC['video'] = name
+        _ENC['preset_args'] = preset_args
+        break
+    _ENC['nvdec'] = _ENC['video'] == 'h264_nvenc' and 'h264_cuvid' in decoders
+    
+    logger.info(f"Кодировщик видео: {_ENC['video']}, "
+                f"декодер NVDEC {'доступен' if _ENC['nvdec'] else 'недоступен'}")
+
+async def probe_video(path):
+    """Параметры видео через ffprobe: размеры, длительность и кодек"""
+    proc = await asyncio.create_subprocess_exec(
+        'ffprobe', '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'stream=width,height,codec_name:format=duration',
+        '-of', 'json', path,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffprobe завершился с ошибкой: {stderr.decode(errors='ignore').strip()}")
+    info = json.loads(stdout)
+    stream = info['streams'][0]
+    return {
+        'width': stream['width'],
+        'height': stream['height'],
+        'duration': float(info['format']['duration']),
+        'codec': stream['codec_name']
+    }
+
+async def crop_to_square(video_path, output_path, width, height, codec):
+    """Обрезка видео до квадрата по центру с перекодированием, возвращает сторону квадрата"""
+    # Стороны должны быть четными для H.264
+    min_size = min(width, height) // 2 * 2
+    video_codec = ['-c:v', _ENC['video'], *_ENC['preset_args']]
+    output_args = ['-b:v', '1000k', '-r', '30', '-c:a', 'aac']
+    
+    if _ENC['nvdec'] and codec == 'h264':
+        # Декодируем и обрезаем на GPU: кадры сразу уходят в NVENC без копирования в ОЗУ
+        top = (height - min_size) // 2
+        left = (width - min_size) // 2
+        crop = f"{top}x{height - min_size - top}x{left}x{width - min_size - left}"
+        try:
+            await run_ffmpeg(
+                '-hwaccel', 'cuda', '-hwaccel_output_format', 'cuda',
+                '-c:v', 'h264_cuvid', '-crop', crop,
+                '-i', video_path,
+                *video_codec, *output_args,
+                output_path
+            )
+            return min_size
+        except RuntimeError as e:
+            # Например, повернутое видео требует программного фильтра
+            logger.warning(f"Аппаратное декодирование не удалось, перекодируем на CPU: {e}")
+    
+    await run_ffmpeg(
+        '-i', video_path,
+        '-vf', f"crop={min_size}:{min_size}",
+        *video_codec, *output_args,
+        output_path
+    )
+    return min_size
+
+async def decode_audio(data, needs_seek=False):
+    """Декодирование аудио в 16 кГц моно float32 для Whisper без промежуточного WAV"""
+    pcm_args = ('-f', 's16le', '-ar', '16000', '-ac', '1', 'pipe:1')
+    if needs_seek:
+        # Например, в MP4/M4A индекс может лежать в конце файла, из канала ffmpeg его не прочитает
+        with tempfile.TemporaryDirectory() as temp_dir:
+            input_path = os.path.join(temp_dir, "input")
+            await asyncio.to_thread(Path(input_path).write_bytes, data)
+            pcm = await run_ffmpeg('-i', input_path, *pcm_args)
+    else:
+        pcm = await run_ffmpeg('-i', 'pipe:0', *pcm_args, input=data)
+    return np.frombuffer(pcm, np.int16).astype(np.float32) / 32768.0
 
-# Клавиатуры
+async def iter_transcription(audio):
+    """Распознавание речи с выдачей фрагментов текста по мере готовности"""
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    done = object()
+    
+    def produce():
+        # Сегменты приходят после декодирования каждого 30-секундного окна речи,
+        # поэтому промежуточный текст появляется только у длинных записей
+        try:
+            segments, _ = whisper_model.transcribe(
+                audio,
+                language='ru',
+                vad_filter=True,
+                beam_size=1
+            )
+            for seg in segments:
+                loop.call_soon_threadsafe(queue.put_nowait, seg.text)
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, done)
+    
+    worker = loop.run_in_executor(_WHISPER_EXECUTOR, produce)
+    try:
+        while (text := await queue.get()) is not done:
+            yield text
+    finally:
+        # Дожидаемся потока даже при досрочном выходе, чтобы слот _HEAVY_JOBS
+        # не освободился раньше времени, и пробрасываем ошибку распознавания
+        await worker
+
+def synthesize_speech(text):
+    """Синтез речи в WAV (блокирующий, вызывается в отдельном потоке)"""
+    buffer = BytesIO()
+    with wave.open(buffer, 'wb') as wav_file:
+        piper_voice.synthesize(text, wav_file)
+    return buffer.getvalue()
+
+# Кэшируются только короткие тексты: повторяются именно фразы, а длинные тексты
+# (до 5000 символов) раздували бы кэш до сотен мегабайт
+TRANSLATE_CACHE_MAX_LEN = 200
+
+def translate_uncached(text, dest):
+    """Перевод текста через Google Translate (блокирующий, только в _TRANSLATE_EXECUTOR)"""
+    translated = translator.translate(text, dest=dest)
+    return translated.src, translated.text
+
+_translate_lru = lru_cache(maxsize=10000)(translate_uncached)
+
+def translate_cached(text, dest):
+    """Перевод текста с кэшированием коротких повторяющихся фраз (блокирующий)"""
+    if len(text) > TRANSLATE_CACHE_MAX_LEN:
+        return translate_uncached(text, dest)
+    return _translate_lru(text, dest)
+
+# Клавиатуры (неизменяемые, собираются один раз и переиспользуются)
+@lru_cache(maxsize=None)
 def get_main_keyboard():
     """Главное меню с 4 кнопками"""
     builder = ReplyKeyboardBuilder()
@@ -88,12 +350,14 @@ def get_main_keyboard():
     )
     return builder.as_markup(resize_keyboard=True)
 
+@lru_cache(maxsize=None)
 def get_back_keyboard():
     """Клавиатура с кнопкой назад"""
     builder = ReplyKeyboardBuilder()
     builder.add(KeyboardButton(text="🔙 Назад в главное меню"))
     return builder.as_markup(resize_keyboard=True)
 
+@lru_cache(maxsize=None)
 def get_languages_keyboard():
     """Инлайн клавиатура для выбора языка"""
     builder = InlineKeyboardBuilder()
@@ -148,57 +412,56 @@ async def convert_to_video_note(message: types.Message, state: FSMContext):
         # Сообщение о начале обработки
         processing_msg = await message.answer("⏳ Обрабатываю видео, подожди немного...")
         
-        # Скачиваем видео
-        video_file = await bot.get_file(message.video.file_id)
-        video_path = f"temp_video_{message.from_user.id}.mp4"
-        await bot.download_file(video_file.file_path, video_path)
-        
-        # Проверка длительности
-        with mp.VideoFileClip(video_path) as clip:
-            duration = clip.duration
+        # Отдельный временный каталог на каждый запрос: параллельные запросы
+        # не пересекаются, а файлы удаляются даже при ошибке
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # Скачиваем видео
+            video_path = os.path.join(temp_dir, "input.mp4")
+            await bot.download(message.video, destination=video_path)
+            
+            # Проверка длительности
+            info = await probe_video(video_path)
+            duration = info['duration']
             if duration > 60:
                 await message.answer(
                     "❌ Видео слишком длинное! Максимальная длина - 60 секунд.\n"
                     "Попробуй другое видео или обрежь это.",
                     reply_markup=get_back_keyboard()
                 )
-                os.remove(video_path)
                 await processing_msg.delete()
                 return
             
-            # Обрезаем до квадрата
-            min_size = min(clip.w, clip.h)
-            cropped = clip.crop(
-                x_center=clip.w/2,
-                y_center=clip.h/2,
-                width=min_size,
-                height=min_size
-            )
+            output_path = os.path.join(temp_dir, "circle.mp4")
+            remuxed = False
+            if info['width'] == info['height'] and info['codec'] == 'h264':
+                # Видео уже квадратное: перекодирование не нужно, достаточно перепаковать
+                # потоки в MP4 (ffprobe не отличает MP4 от MOV/3GP, поэтому делаем это всегда)
+                size = info['width']
+                try:
+                    await run_ffmpeg('-i', video_path, '-c', 'copy', '-f', 'mp4', output_path)
+                    remuxed = True
+                except RuntimeError as e:
+                    # Например, звуковую дорожку нельзя положить в MP4 без перекодирования
+                    logger.warning(f"Не удалось перепаковать видео, перекодируем: {e}")
+            if not remuxed:
+                # Обрезаем до квадрата
+                async with _HEAVY_JOBS:
+                    size = await crop_to_square(
+                        video_path, output_path,
+                        info['width'], info['height'], info['codec']
+                    )
             
-            # Сохраняем результат
-            output_path = f"circle_{message.from_user.id}.mp4"
-            cropped.write_videofile(
-                output_path,
-                codec='libx264',
-                audio_codec='aac',
-                temp_audiofile='temp-audio.m4a',
-                remove_temp=True,
-                fps=30,
-                preset='medium',
-                bitrate='1000k'
-            )
+            # Читаем результат в память, чтобы освободить временный каталог до загрузки
+            note_data = await asyncio.to_thread(Path(output_path).read_bytes)
         
         # Отправляем как видеосообщение
-        video_note = FSInputFile(output_path)
+        video_note = BufferedInputFile(note_data, filename="circle.mp4")
         await message.answer_video_note(
             video_note,
             duration=int(duration),
-            length=min_size
+            length=size
         )
         
-        # Очистка
-        os.remove(video_path)
-        os.remove(output_path)
         await processing_msg.delete()
         
         logger.info(f"Пользователь {message.from_user.id} конвертировал видео в кружок")
@@ -234,28 +497,33 @@ async def audio_to_text_process(message: types.Message, state: FSMContext):
     try:
         processing_msg = await message.answer("⏳ Распознаю речь, это может занять несколько секунд...")
         
-        # Получаем файл
-        if message.voice:
-            file_id = message.voice.file_id
-        else:
-            file_id = message.audio.file_id
-            
-        audio_file = await bot.get_file(file_id)
-        audio_path = f"temp_audio_{message.from_user.id}.ogg"
-        await bot.download_file(audio_file.file_path, audio_path)
+        # Скачиваем файл сразу в память
+        audio_buffer = await bot.download(message.voice or message.audio)
         
-        # Конвертируем в формат, понятный Whisper
-        import subprocess
-        converted_path = f"converted_{message.from_user.id}.wav"
-        subprocess.run([
-            'ffmpeg', '-i', audio_path, 
-            '-ar', '16000', '-ac', '1', '-c:a', 'pcm_s16le',
-            converted_path, '-y'
-        ], capture_output=True)
+        # Конвертируем в формат, понятный Whisper. Голосовые всегда OGG/Opus и читаются
+        # из канала, а аудиофайлы могут быть в любом контейнере, поэтому идут через диск
+        audio = await decode_audio(audio_buffer.getvalue(), needs_seek=message.voice is None)
         
-        # Распознаем текст
-        result = whisper_model.transcribe(converted_path, language='ru')
-        recognized_text = result["text"].strip()
+        # Распознаем текст, показывая промежуточный результат (для записей длиннее
+        # ~30 секунд речи) не чаще раза в секунду
+        parts = []
+        last_edit = time.monotonic()
+        async with _HEAVY_JOBS:
+            transcription = iter_transcription(audio)
+            try:
+                async for text in transcription:
+                    parts.append(text)
+                    partial_text = "".join(parts).strip()
+                    if partial_text and time.monotonic() - last_edit >= 1:
+                        last_edit = time.monotonic()
+                        # Промежуточный вывод необязателен: ошибки Telegram здесь не прерывают распознавание
+                        with suppress(TelegramAPIError):
+                            await processing_msg.edit_text(
+                                f"⏳ Распознаю речь...\n\n{partial_text[-3500:]}"
+                            )
+            finally:
+                await transcription.aclose()
+        recognized_text = "".join(parts).strip()
         
         if recognized_text:
             await message.answer(
@@ -263,26 +531,21 @@ async def audio_to_text_process(message: types.Message, state: FSMContext):
                 reply_markup=get_back_keyboard()
             )
             
-            # Сохраняем в файл
-            text_file_path = f"text_{message.from_user.id}.txt"
-            with open(text_file_path, 'w', encoding='utf-8') as f:
-                f.write(recognized_text)
-            
-            text_file = FSInputFile(text_file_path)
+            # Отправляем файлом прямо из памяти
+            text_file = BufferedInputFile(
+                recognized_text.encode('utf-8'),
+                filename=f"text_{message.from_user.id}.txt"
+            )
             await message.answer_document(
                 text_file,
                 caption="📄 Текст в файле"
             )
-            os.remove(text_file_path)
         else:
             await message.answer(
                 "❌ Не удалось распознать речь. Попробуй еще раз.",
                 reply_markup=get_back_keyboard()
             )
         
-        # Очистка
-        os.remove(audio_path)
-        os.remove(converted_path)
         await processing_msg.delete()
         
         logger.info(f"Пользователь {message.from_user.id} распознал аудио в текст")
@@ -310,11 +573,7 @@ async def select_language(callback: types.CallbackQuery, state: FSMContext):
     lang_code = callback.data.replace("lang_", "")
     
     # Находим название языка по коду
-    lang_name = "неизвестный язык"
-    for name, code in LANGUAGES.items():
-        if code == lang_code:
-            lang_name = name
-            break
+    lang_name = LANG_NAME_BY_CODE.get(lang_code, "неизвестный язык")
     
     await state.update_data(target_lang=lang_code, target_lang_name=lang_name)
     await state.set_state(BotStates.translate_mode)
@@ -342,12 +601,13 @@ async def translate_text(message: types.Message, state: FSMContext):
         
         processing_msg = await message.answer("⏳ Перевожу...")
         
-        translator = GoogleTranslator()
-        translated = translator.translate(message.text, dest=target_lang)
+        src_lang, translated_text = await asyncio.get_running_loop().run_in_executor(
+            _TRANSLATE_EXECUTOR, translate_cached, message.text, target_lang
+        )
         
         result_text = (
-            f"🔤 Оригинал ({translated.src}):\n{message.text}\n\n"
-            f"✅ Перевод ({target_lang_name}):\n{translated.text}"
+            f"🔤 Оригинал ({src_lang}):\n{message.text}\n\n"
+            f"✅ Перевод ({target_lang_name}):\n{translated_text}"
         )
         
         await message.answer(result_text, reply_markup=get_back_keyboard())
@@ -375,6 +635,13 @@ async def text_to_audio_start(message: types.Message, state: FSMContext):
 @dp.message(BotStates.text_to_audio_mode)
 async def text_to_audio_process(message: types.Message, state: FSMContext):
     """Озвучка текста"""
+    if piper_voice is None:
+        await message.answer(
+            "❌ Модель озвучки не загружена. Попробуй позже.",
+            reply_markup=get_back_keyboard()
+        )
+        return
+    
     try:
         text = message.text
         
@@ -388,20 +655,23 @@ async def text_to_audio_process(message: types.Message, state: FSMContext):
         
         processing_msg = await message.answer("⏳ Создаю аудиофайл...")
         
-        # Создаем аудио
-        audio_path = f"tts_{message.from_user.id}.ogg"
-        tts = gTTS(text=text, lang='ru', slow=False)
-        tts.save(audio_path)
+        # Синтезируем речь локально и кодируем в OGG/Opus для голосового сообщения
+        async with _HEAVY_JOBS:
+            wav_data = await asyncio.to_thread(synthesize_speech, text)
+        ogg_data = await run_ffmpeg(
+            '-i', 'pipe:0',
+            '-c:a', 'libopus', '-b:a', '32k',
+            '-f', 'ogg', 'pipe:1',
+            input=wav_data
+        )
         
         # Отправляем как голосовое сообщение
-        audio_file = FSInputFile(audio_path)
+        audio_file = BufferedInputFile(ogg_data, filename="tts.ogg")
         await message.answer_voice(
             audio_file,
             caption="🎧 Готово!"
         )
         
-        # Очистка
-        os.remove(audio_path)
         await processing_msg.delete()
         
         logger.info(f"Пользователь {message.from_user.id} создал аудио из текста")
@@ -441,9 +711,21 @@ async def unknown_message(message: types.Message):
     )
 
 # Запуск бота
+async def on_shutdown():
+    """Явное закрытие HTTP-клиента переводчика при остановке (не полагаемся на сборщик мусора)"""
+    # Опрос уже остановлен, новых переводов не будет. Закрываем клиент не через
+    # _TRANSLATE_EXECUTOR, чтобы не ждать незавершенный перевод до таймаута
+    await asyncio.to_thread(translator.client.close)
+
 async def main():
     logger.info("Запуск бота...")
+    await detect_encoders()
+    dp.shutdown.register(on_shutdown)
+    # Сессию бота start_polling закрывает сам (close_bot_session=True)
     await dp.start_polling(bot)
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if uvloop is not None:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())